@@ -0,0 +1,389 @@
+"""
+Shared proxy core for Shimmy - SAP AI Core RBAC Workaround
+make_app() builds the FastAPI app behind every proxy entrypoint:
+- lightweight-proxy.py      -> make_app(shimmy_url=...)
+- model-downloader-proxy.py -> make_app(shimmy_url=..., enable_pull=True)
+- proxy-wrapper.py          -> make_app(shimmy_url=..., openai_transform=True)
+
+Runs as an ASGI app (FastAPI + Uvicorn) sharing one pooled httpx.AsyncClient,
+so in-flight forwards to Shimmy don't each hold an OS thread.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from pathlib import Path
+from fastapi import FastAPI, Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.middleware.gzip import DEFAULT_EXCLUDED_CONTENT_TYPES, GZipMiddleware
+import httpx
+import orjson
+import uvicorn
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+SHIMMY_SOCKET = os.environ.get("SHIMMY_SOCKET")  # Optional Unix socket Shimmy listens on natively
+# One async worker already multiplexes all forwards; extra workers each cost an
+# interpreter and connection pool out of the memory Shimmy shares with the pod
+PROXY_WORKERS = int(os.environ.get("PROXY_WORKERS", 1))
+HEALTH_TTL = 1.0  # Seconds a /v1/health result is reused across pollers
+
+JSON_HEADERS = {"Content-Type": "application/json"}
+# Keep intermediaries (nginx ingress, Istio) from buffering token streams
+STREAM_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+    "Connection": "keep-alive"
+}
+
+def passthrough(resp):
+    """Return an upstream Shimmy response verbatim, without a JSON round-trip"""
+    return Response(
+        resp.content,
+        status_code=resp.status_code,
+        media_type=resp.headers.get("Content-Type", "application/json")
+    )
+
+def ojson(obj, code=200):
+    """Serialize a proxy-generated JSON payload with orjson"""
+    return Response(orjson.dumps(obj), status_code=code, media_type="application/json")
+
+def to_shimmy_request(data, default_model):
+    """Transform an OpenAI-style completion request to Shimmy's /api/generate format"""
+    # Extract prompt from messages or direct prompt
+    if 'messages' in data:
+        # Chat completion format
+        prompt = "\n".join(
+            f"{msg.get('role', 'user')}: {msg.get('content', '')}"
+            for msg in data.get('messages', [])
+        )
+    else:
+        # Direct prompt format
+        prompt = data.get('prompt', '')
+
+    return {
+        "model": data.get("model", default_model),
+        "prompt": prompt,
+        "stream": data.get("stream", False),
+        "temperature": data.get("temperature", 0.7),
+        "max_tokens": data.get("max_tokens", 512),
+        "top_p": data.get("top_p", 1.0),
+        "frequency_penalty": data.get("frequency_penalty", 0.0),
+        "presence_penalty": data.get("presence_penalty", 0.0)
+    }
+
+def to_openai_response(data, shimmy_resp, default_model):
+    """Transform a Shimmy /api/generate response to OpenAI format"""
+    # Handle both completion and chat completion formats
+    if 'messages' in data:
+        # Chat completion response
+        return {
+            "id": f"chatcmpl-{hash(shimmy_resp.get('response', ''))}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": data.get("model", default_model),
+            "choices": [{
+                "index": 0,
+                "message": {
+                    "role": "assistant",
+                    "content": shimmy_resp.get("response", "")
+                },
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": shimmy_resp.get("prompt_eval_count", 0),
+                "completion_tokens": shimmy_resp.get("eval_count", 0),
+                "total_tokens": shimmy_resp.get("prompt_eval_count", 0) + shimmy_resp.get("eval_count", 0)
+            }
+        }
+    # Text completion response
+    return {
+        "id": f"cmpl-{hash(shimmy_resp.get('response', ''))}",
+        "object": "text_completion",
+        "created": int(time.time()),
+        "model": data.get("model", default_model),
+        "choices": [{
+            "text": shimmy_resp.get("response", ""),
+            "index": 0,
+            "finish_reason": "stop"
+        }]
+    }
+
+def make_app(*, shimmy_url, enable_pull=False, openai_transform=False,
+             default_model="", service="Shimmy Lightweight Proxy", version="1.0.0"):
+    """
+    Build a proxy app forwarding to Shimmy at shimmy_url
+    - enable_pull: also serve /v1/api/pull (needs huggingface_hub)
+    - openai_transform: reshape /v1/completions replies into OpenAI format
+      instead of passing Shimmy's response through
+    """
+    pull = None
+    if enable_pull:
+        # Imported lazily so proxies without pull don't need huggingface_hub
+        import proxy_pull as pull
+
+    # Shared upstream client, created once per worker on startup
+    client = None
+
+    # Last /v1/health result; SAP AI Core polls it far more often than
+    # Shimmy's health can change
+    health_cache = {"t": 0.0, "body": None, "code": 503, "media_type": "application/json"}
+    health_lock = asyncio.Lock()
+
+    @asynccontextmanager
+    async def lifespan(app):
+        nonlocal client
+        # Keep-alive pool to Shimmy; connect failures (e.g. Shimmy restarting
+        # after a model pull) are retried before any request bytes are sent.
+        # With SHIMMY_SOCKET set, forwards skip loopback TCP entirely
+        transport = httpx.AsyncHTTPTransport(
+            uds=SHIMMY_SOCKET,
+            retries=2,
+            limits=httpx.Limits(
+                max_keepalive_connections=200,  # Single upstream host: keep the whole pool alive
+                max_connections=200,
+                keepalive_expiry=30
+            )
+        )
+        client = httpx.AsyncClient(base_url=shimmy_url, timeout=300, transport=transport)
+        if pull is not None:
+            app.state.shimmy_admin = pull.admin_client(shimmy_url)
+        yield
+        await client.aclose()
+        if pull is not None and app.state.shimmy_admin is not None:
+            app.state.shimmy_admin.close()
+
+    app = FastAPI(lifespan=lifespan)
+    # Compress large JSON bodies such as /v1/models; ndjson token streams are
+    # left alone so each chunk still reaches the client as soon as it is sent
+    app.add_middleware(
+        GZipMiddleware,
+        minimum_size=1024,
+        compresslevel=6,
+        exclude_content_types=DEFAULT_EXCLUDED_CONTENT_TYPES + ("application/x-ndjson",)
+    )
+
+    if pull is not None:
+        pull.register_pull_routes(app)
+
+    @app.get('/v1/health')
+    async def v1_health():
+        """
+        SAP AI Core health check endpoint
+        Maps /v1/health (RBAC allowed) -> Shimmy's /health
+        Results are cached for HEALTH_TTL so concurrent pollers share one upstream call
+        """
+        # Only one poller refreshes; the rest wait and reuse its result
+        async with health_lock:
+            if time.monotonic() - health_cache["t"] >= HEALTH_TTL:
+                try:
+                    logger.info("Proxying /v1/health to Shimmy /health")
+                    resp = await client.get("/health", timeout=5)
+                    body = resp.content
+                    code = resp.status_code
+                    media_type = resp.headers.get("Content-Type", "application/json")
+                except httpx.HTTPError as e:
+                    logger.error(f"Health check failed: {e}")
+                    body = orjson.dumps({
+                        "status": "unhealthy",
+                        "error": str(e)
+                    })
+                    code = 503
+                    media_type = "application/json"
+                health_cache.update(t=time.monotonic(), body=body, code=code, media_type=media_type)
+
+        return Response(
+            health_cache["body"],
+            status_code=health_cache["code"],
+            media_type=health_cache["media_type"]
+        )
+
+    @app.post('/v1/generate')
+    async def v1_generate(request: Request):
+        """
+        SAP AI Core generate endpoint
+        Maps /v1/generate (RBAC allowed) -> Shimmy's /api/generate
+        Supports both streaming and non-streaming responses
+        """
+        try:
+            body = await request.body()
+            data = orjson.loads(body)
+            logger.info(f"Proxying /v1/generate to Shimmy /api/generate for model: {data.get('model', 'unknown')}")
+
+            # Check if streaming is requested
+            is_stream = data.get('stream', False)
+
+            if is_stream:
+                # Handle streaming response
+                async def generate():
+                    try:
+                        # Relay Shimmy's bytes untouched; ask for an identity body so
+                        # raw chunks never carry a Content-Encoding we don't forward
+                        async with client.stream(
+                            "POST",
+                            "/api/generate",
+                            content=body,
+                            headers={**JSON_HEADERS, "Accept-Encoding": "identity"}
+                        ) as resp:
+                            async for chunk in resp.aiter_raw():
+                                yield chunk
+                    except Exception as e:
+                        logger.error(f"Streaming error: {e}")
+                        yield orjson.dumps({"error": str(e)}) + b"\n"
+
+                return StreamingResponse(generate(), media_type='application/x-ndjson', headers=STREAM_HEADERS)
+            else:
+                # Forward the client's JSON body as-is rather than re-encoding it
+                resp = await client.post("/api/generate", content=body, headers=JSON_HEADERS)
+                return passthrough(resp)
+
+        except httpx.HTTPError as e:
+            logger.error(f"Generate request failed: {e}")
+            return ojson({
+                "error": str(e)
+            }, 500)
+        except Exception as e:
+            logger.error(f"Unexpected error in /v1/generate: {e}")
+            return ojson({
+                "error": str(e)
+            }, 500)
+
+    @app.get('/v1/models')
+    async def v1_models():
+        """
+        Models endpoint - direct passthrough to Shimmy's /v1/models
+        This endpoint already works, included for completeness
+        """
+        try:
+            logger.info("Proxying /v1/models to Shimmy")
+            resp = await client.get("/v1/models", timeout=5)
+            return passthrough(resp)
+        except httpx.HTTPError as e:
+            logger.error(f"Models list failed: {e}")
+            return ojson({"error": str(e)}, 500)
+
+    @app.post('/v1/completions')
+    @app.post('/v1/chat/completions')
+    async def v1_completions(request: Request):
+        """
+        OpenAI-compatible completions endpoint
+        Maps to Shimmy's /api/generate with format transformation
+        """
+        try:
+            data = orjson.loads(await request.body())
+            logger.info(f"Proxying /v1/completions to Shimmy /api/generate for model: {data.get('model', default_model)}")
+            shimmy_request = to_shimmy_request(data, default_model)
+
+            # Handle streaming responses
+            if openai_transform and shimmy_request["stream"]:
+                async def generate():
+                    async with client.stream(
+                        "POST",
+                        "/api/generate",
+                        content=orjson.dumps(shimmy_request),
+                        headers=JSON_HEADERS
+                    ) as resp:
+                        async for line in resp.aiter_lines():
+                            if line:
+                                yield line + '\n'
+
+                return StreamingResponse(generate(), media_type='text/event-stream', headers=STREAM_HEADERS)
+
+            # Forward to Shimmy
+            resp = await client.post(
+                "/api/generate",
+                content=orjson.dumps(shimmy_request),
+                headers=JSON_HEADERS
+            )
+
+            if not openai_transform:
+                # Return Shimmy's response (client can handle the format)
+                return passthrough(resp)
+
+            # Transform Shimmy response to OpenAI format
+            openai_resp = to_openai_response(data, orjson.loads(resp.content), default_model)
+            logger.info("Successfully transformed and returned response")
+            return ojson(openai_resp, resp.status_code)
+
+        except Exception as e:
+            logger.error(f"Completion request failed: {e}")
+            if openai_transform:
+                return ojson({
+                    "error": {
+                        "message": str(e),
+                        "type": "internal_error",
+                        "code": "proxy_error"
+                    }
+                }, 500)
+            return ojson({"error": str(e)}, 500)
+
+    @app.get('/health')
+    async def health():
+        """
+        Comprehensive health check for SAP AI Core
+        Checks both proxy and Shimmy backend availability
+        """
+        try:
+            # Check if Shimmy backend is responding
+            resp = await client.get("/health", timeout=2)
+            if resp.status_code == 200:
+                return ojson({
+                    "status": "healthy",
+                    "proxy": "running",
+                    "shimmy": "ready",
+                    "timestamp": int(time.time())
+                }, 200)
+            else:
+                logger.warning(f"Shimmy health check returned status {resp.status_code}")
+                return ojson({
+                    "status": "degraded",
+                    "proxy": "running",
+                    "shimmy": "unhealthy"
+                }, 503)
+        except httpx.HTTPError as e:
+            logger.error(f"Shimmy backend unreachable: {e}")
+            return ojson({
+                "status": "unhealthy",
+                "proxy": "running",
+                "shimmy": "unreachable",
+                "error": str(e)
+            }, 503)
+
+    @app.get('/')
+    async def root():
+        """Root endpoint for basic connectivity check"""
+        info = {
+            "service": service,
+            "status": "running",
+            "version": version,
+            "endpoints": {
+                "health": "/v1/health",
+                "generate": "/v1/generate",
+                "models": "/v1/models",
+                "completions": "/v1/completions"
+            }
+        }
+        if pull is not None:
+            info["endpoints"]["pull"] = "/v1/api/pull"
+            info["download_status"] = pull.download_status()
+        return ojson(info, 200)
+
+    return app
+
+def serve(entrypoint, port, workers=PROXY_WORKERS):
+    """Run the `app` of an entrypoint script under Uvicorn"""
+    # Workers re-import the entrypoint by name, so pass an import string
+    uvicorn.run(
+        f"{Path(entrypoint).stem}:app",
+        app_dir=str(Path(entrypoint).parent),
+        host='0.0.0.0',
+        port=port,
+        workers=workers
+    )
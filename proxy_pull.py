@@ -0,0 +1,405 @@
+"""
+Model download support for the Shimmy proxy
+Registers /v1/api/pull, which downloads GGUF models from HuggingFace into
+MODELS_DIR and restarts Shimmy so it picks them up.
+Download state lives in-process, so apps using it run a single worker.
+Different models download concurrently; duplicate pulls are rejected.
+"""
+
+import logging
+import os
+import queue
+import signal
+import threading
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+import httpx
+import orjson
+
+# huggingface_hub reads these once at import time. Download with parallel
+# range requests: hf_transfer on huggingface_hub < 1.0, Xet's
+# high-performance mode (its replacement) on newer releases
+os.environ.setdefault("HF_HUB_ENABLE_HF_TRANSFER", "1")
+os.environ.setdefault("HF_XET_HIGH_PERFORMANCE", "1")
+os.environ.setdefault("HF_HOME", "/models/.cache/huggingface")
+
+from huggingface_hub import hf_hub_download
+from huggingface_hub.utils import HfHubHTTPError, tqdm as hf_tqdm
+
+from proxy_core import SHIMMY_SOCKET, STREAM_HEADERS, ojson
+
+logger = logging.getLogger(__name__)
+
+MODELS_DIR = "/models"
+SHIMMY_PID_FILE = os.environ.get("SHIMMY_PID_FILE", "/tmp/shimmy.pid")  # Written by the start script
+HF_TOKEN = os.environ.get("HF_TOKEN")  # Authenticated downloads get higher rate limits
+# Shimmy HTTP route that rescans the models directory (e.g. /api/models/discover
+# on Shimmy builds that serve it). Unset: always run `shimmy discover`
+SHIMMY_DISCOVER_PATH = os.environ.get("SHIMMY_DISCOVER_PATH")
+HF_REVISION = "main"
+
+# Download state management: in-progress pulls keyed by resolved local path,
+# since every request resolving to the same file would write the same bytes
+download_lock = threading.Lock()
+current_downloads = {}
+
+# Serializes discovery + restart so concurrent pulls don't signal a Shimmy
+# the start script has only just relaunched
+restart_lock = threading.Lock()
+signalled_pid = None  # Last Shimmy PID sent SIGTERM
+
+# Downloads run here, off the response thread, so progress can stream
+MAX_DOWNLOADS = int(os.environ.get("MAX_DOWNLOADS", 4))  # Concurrent pulls of different models
+EXECUTOR = ThreadPoolExecutor(max_workers=MAX_DOWNLOADS, thread_name_prefix="hf-download")
+PROGRESS_INTERVAL = 0.5  # Seconds between progress events
+
+# Local model paths Shimmy is known to have picked up; pulling any other
+# file that is already on disk reruns discovery for it
+discovered = set()
+
+# Set once Shimmy answers 404/405 on SHIMMY_DISCOVER_PATH, so later pulls
+# go straight to the CLI instead of probing the route again
+discover_route_missing = False
+
+def download_status():
+    """Snapshot of the in-progress downloads for the root endpoint"""
+    with download_lock:
+        downloads = list(current_downloads.values())
+    return {
+        "in_progress": bool(downloads),
+        "downloads": downloads
+    }
+
+def release_download(path):
+    """Clear the in-progress marker for the download writing path"""
+    with download_lock:
+        current_downloads.pop(path, None)
+
+def queue_progress_tqdm(events):
+    """Build a tqdm class that reports hf_hub_download progress into a queue"""
+    class QueueTqdm(hf_tqdm):
+        _last_event = 0.0
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            # Count bytes ourselves: tqdm disables itself (and stops advancing
+            # self.n) when stderr is not a TTY, i.e. in every container
+            self.downloaded = kwargs.get("initial", 0)
+
+        def update(self, n=1):
+            result = super().update(n)
+            self.downloaded += n or 0
+            now = time.monotonic()
+            if now - self._last_event >= PROGRESS_INTERVAL or (self.total and self.downloaded >= self.total):
+                self._last_event = now
+                events.put({"status": "progress", "downloaded": self.downloaded, "total": self.total})
+            return result
+
+    return QueueTqdm
+
+def model_path(filename):
+    """Local path for a requested filename, or None if it would land outside MODELS_DIR"""
+    models_dir = os.path.realpath(MODELS_DIR)
+    path = os.path.realpath(os.path.join(models_dir, filename))
+    if os.path.commonpath([models_dir, path]) != models_dir or path == models_dir:
+        return None
+    return path
+
+def discover_model(admin, path):
+    """Run discovery + restart for a downloaded file, recording it once that succeeds"""
+    with restart_lock:
+        success = trigger_shimmy_discover_and_restart(admin)
+    if success:
+        discovered.add(path)
+    else:
+        discovered.discard(path)
+    return success
+
+def local_stat(path):
+    """Identity of a local file (inode, size, mtime), or None if it doesn't exist"""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+def check_gguf_file(filepath):
+    """Verify that the downloaded file is a valid GGUF file"""
+    try:
+        # Unbuffered pread of just the header; no Python file object needed
+        fd = os.open(filepath, os.O_RDONLY)
+        try:
+            magic = os.pread(fd, 4, 0)
+        finally:
+            os.close(fd)
+        # GGUF magic number is 'GGUF' (0x46554747)
+        return magic in (b'GGUF', b'GGML')  # Support both GGUF and older GGML
+    except Exception as e:
+        logger.error(f"Failed to verify GGUF file: {e}")
+        return False
+
+def shimmy_discover(admin):
+    """
+    Ask Shimmy to rescan MODELS_DIR
+    Uses Shimmy's HTTP discover route when SHIMMY_DISCOVER_PATH is set; falls
+    back to running `shimmy discover` when the route is missing or Shimmy is
+    unreachable
+    """
+    global discover_route_missing
+    if admin is not None and not discover_route_missing:
+        try:
+            resp = admin.post(SHIMMY_DISCOVER_PATH)
+            if resp.status_code in (404, 405):
+                logger.info(f"Shimmy has no {SHIMMY_DISCOVER_PATH} route, using `shimmy discover`")
+                discover_route_missing = True
+            elif resp.is_success:
+                logger.info(f"Shimmy discover completed: {resp.text}")
+                return True
+            else:
+                logger.error(f"Shimmy discover failed: HTTP {resp.status_code} {resp.text}")
+                return False
+        except httpx.HTTPError as e:
+            logger.warning(f"Shimmy discover route unreachable ({e}), using `shimmy discover`")
+
+    # Run shimmy discover
+    result = subprocess.run(
+        ['shimmy', 'discover'],
+        capture_output=True,
+        text=True,
+        timeout=10
+    )
+    if result.returncode == 0:
+        logger.info(f"Shimmy discover completed: {result.stdout}")
+        return True
+    logger.error(f"Shimmy discover failed: {result.stderr}")
+    return False
+
+def trigger_shimmy_discover_and_restart(admin):
+    """Trigger Shimmy to discover new models and restart the Shimmy server process"""
+    global signalled_pid
+    try:
+        if not shimmy_discover(admin):
+            return False
+
+        # Restart Shimmy server process using the PID recorded by the start script
+        try:
+            pid = int(Path(SHIMMY_PID_FILE).read_text().strip())
+            if pid == signalled_pid:
+                # Already told to stop and not relaunched yet; the next instance
+                # scans the models directory, picking this file up too
+                logger.info(f"Shimmy (PID: {pid}) restart already pending")
+                return True
+            logger.info(f"Found Shimmy serve process (PID: {pid}), terminating for restart...")
+            # Send SIGTERM to gracefully terminate - the start script will restart it
+            os.kill(pid, signal.SIGTERM)
+            signalled_pid = pid
+            logger.info("SIGTERM sent to Shimmy server - start script will restart with new models")
+            return True
+        except FileNotFoundError:
+            logger.warning(f"No Shimmy PID file at {SHIMMY_PID_FILE}, models may not be available until restart")
+            return True  # Discovery still succeeded
+        except Exception as e:
+            logger.warning(f"Failed to terminate Shimmy process: {e}")
+            return True  # Discovery still succeeded
+
+    except Exception as e:
+        logger.error(f"Failed to run shimmy discover: {e}")
+        return False
+
+def admin_client(shimmy_url):
+    """
+    Client for Shimmy's discover route, or None when SHIMMY_DISCOVER_PATH is unset
+    Sync, since discovery runs on the download's worker thread rather than the
+    event loop; the app's lifespan opens it as app.state.shimmy_admin and closes it
+    """
+    if not SHIMMY_DISCOVER_PATH:
+        return None
+    return httpx.Client(
+        base_url=shimmy_url,
+        timeout=10,
+        transport=httpx.HTTPTransport(uds=SHIMMY_SOCKET)
+    )
+
+def run_pull(admin, model_repo, filename, candidate, force_discover, progress):
+    """
+    Download a model and have Shimmy load it; runs on EXECUTOR
+    Owns the whole pull, including releasing its in-progress marker, so it
+    finishes even if the client streaming its progress disconnects.
+    Returns the final event for the progress stream
+    """
+    try:
+        # On a refresh, hf_hub_download compares the remote etag with
+        # the local copy and leaves an unchanged file untouched
+        before = local_stat(candidate)
+
+        # Ensure models directory exists
+        os.makedirs(MODELS_DIR, exist_ok=True)
+
+        # Download file from HuggingFace, reporting progress events as the
+        # tqdm hook sees them
+        local_path = hf_hub_download(
+            repo_id=model_repo,
+            filename=filename,
+            revision=HF_REVISION,
+            cache_dir=None,
+            local_dir=MODELS_DIR,
+            local_dir_use_symlinks=False,
+            token=HF_TOKEN,
+            tqdm_class=queue_progress_tqdm(progress)
+        )
+
+        # Unchanged upstream: no new model, so no restart unless
+        # discovery is still owed for this file
+        if before is not None and local_stat(local_path) == before and check_gguf_file(local_path):
+            logger.info(f"Local copy matches HuggingFace, nothing downloaded: {local_path}")
+            cached = {"status": "cached", "filename": filename, "path": local_path}
+            if force_discover or candidate not in discovered:
+                cached["discovered"] = discover_model(admin, candidate)
+            return cached
+
+        # Verify it's a GGUF file
+        if not check_gguf_file(local_path):
+            os.remove(local_path)
+            return {"status": "error", "error": "Downloaded file is not a valid GGUF/GGML model"}
+
+        # Get file size
+        file_size = os.path.getsize(local_path)
+        size_mb = round(file_size / (1024 * 1024), 2)
+
+        # Trigger Shimmy to discover the new model and restart server
+        logger.info("Triggering shimmy discover and server reload for new model...")
+        discover_success = discover_model(admin, candidate)
+        logger.info(f"Download complete: {local_path} ({size_mb} MB), Model discovery: {'success' if discover_success else 'failed'}")
+
+        return {
+            "status": "complete",
+            "filename": filename,
+            "path": local_path,
+            "size_mb": size_mb,
+            "discovered": discover_success
+        }
+
+    except HfHubHTTPError as e:
+        error_msg = f"HuggingFace error: {str(e)}"
+        logger.error(error_msg)
+        return {"status": "error", "error": error_msg}
+    except Exception as e:
+        error_msg = f"Download failed: {str(e)}"
+        logger.error(error_msg)
+        return {"status": "error", "error": error_msg}
+    finally:
+        release_download(candidate)
+
+def register_pull_routes(app):
+    """Add the /v1/api/pull endpoint to a proxy app"""
+    # The start script launches Shimmy with --model-path MODELS_DIR, so models
+    # already there when the proxy starts were loaded without our help
+    if os.path.isdir(MODELS_DIR):
+        for entry in os.scandir(MODELS_DIR):
+            if entry.is_file() and check_gguf_file(entry.path):
+                discovered.add(os.path.realpath(entry.path))
+
+    @app.post('/v1/api/pull')
+    async def pull_model(request: Request):
+        """
+        Download a GGUF model from HuggingFace
+        Request body: {
+            "model": "TheBloke/phi-3-mini-4k-instruct-GGUF",
+            "filename": "phi-3-mini-4k-instruct.Q4_K_M.gguf",
+            "refresh": false  (optional, re-download if HuggingFace has a different version)
+            "discover": false  (optional, rerun Shimmy discovery for an already downloaded file)
+        }
+        """
+        admin = request.app.state.shimmy_admin
+        key = None
+        future = None
+        try:
+            data = orjson.loads(await request.body())
+            if not data:
+                return ojson({"status": "error", "error": "Request body required"}, 400)
+
+            model_repo = data.get('model')
+            filename = data.get('filename')
+
+            if not model_repo or not filename:
+                return ojson({
+                    "status": "error",
+                    "error": "Both 'model' and 'filename' are required"
+                }, 400)
+
+            # Never touch anything outside the models directory
+            candidate = model_path(filename)
+            if candidate is None:
+                return ojson({
+                    "status": "error",
+                    "error": f"Invalid filename: {filename}"
+                }, 400)
+
+            # Already downloaded (e.g. a retried pull): answer without touching
+            # HuggingFace or the download lock. Discovery is rerun unless it is
+            # known to have succeeded for this file, or if the caller asks for it
+            if not data.get('refresh') and os.path.isfile(candidate) and check_gguf_file(candidate):
+                logger.info(f"Model already present, skipping download: {candidate}")
+                cached = {"status": "cached", "filename": filename, "path": candidate}
+                if data.get('discover') or candidate not in discovered:
+                    cached["discovered"] = await run_in_threadpool(discover_model, admin, candidate)
+                return ojson(cached, 200)
+
+            # Only one pull per target file: any request resolving to the same
+            # local path (another repo, "./x.gguf", ...) would write the same file
+            with download_lock:
+                busy = current_downloads.get(candidate)
+                if busy is not None:
+                    return ojson({
+                        "status": "error",
+                        "error": f"Download already in progress: {busy['model']}/{busy['filename']}"
+                    }, 409)
+
+                # Mark download as in progress
+                current_downloads[candidate] = {
+                    "model": model_repo,
+                    "filename": filename,
+                    "started": int(time.time())
+                }
+                key = candidate
+
+            # The pull runs to completion on EXECUTOR whether or not this
+            # client stays connected; the response only relays its progress
+            logger.info(f"Starting download: {model_repo}/{filename}")
+            progress = queue.Queue()
+            future = EXECUTOR.submit(
+                run_pull, admin, model_repo, filename, candidate,
+                bool(data.get('discover')), progress
+            )
+
+            def generate():
+                """Stream download progress"""
+                # Send starting message
+                yield orjson.dumps({"status": "starting", "model": model_repo, "filename": filename}) + b"\n"
+                while not future.done():
+                    try:
+                        event = progress.get(timeout=PROGRESS_INTERVAL)
+                    except queue.Empty:
+                        continue
+                    yield orjson.dumps(event) + b"\n"
+                # Relay events queued between the last poll and completion
+                while not progress.empty():
+                    yield orjson.dumps(progress.get_nowait()) + b"\n"
+                yield orjson.dumps(future.result()) + b"\n"
+
+            # Sync generator: Starlette iterates it in a threadpool, keeping the
+            # blocking waits off the event loop
+            return StreamingResponse(generate(), media_type='application/x-ndjson', headers=STREAM_HEADERS)
+
+        except Exception as e:
+            # Make sure to release lock on any error (once submitted, the
+            # pull releases it itself)
+            if key is not None and future is None:
+                release_download(key)
+            logger.error(f"Error in pull_model: {e}")
+            return ojson({"status": "error", "error": str(e)}, 500)
@@ -1,6 +1,9 @@
 #!/bin/bash
 set -e
 
+# Shimmy PID is recorded here so the proxy can signal a restart after a pull
+export SHIMMY_PID_FILE=${SHIMMY_PID_FILE:-/tmp/shimmy.pid}
+
 echo "=========================================="
 echo "Starting Shimmy with GPU Support (CUDA)"
 echo "=========================================="
@@ -37,6 +40,7 @@ shimmy serve \
     --gpu-backend ${SHIMMY_GPU_BACKEND:-cuda} \
     --model-path ${SHIMMY_MODEL_PATH:-/models} &
 SHIMMY_PID=$!
+echo $SHIMMY_PID > "$SHIMMY_PID_FILE"
 
 # Wait for Shimmy to be ready
 echo "Waiting for Shimmy to be ready..."
@@ -93,6 +97,7 @@ cleanup() {
     kill $SHIMMY_PID 2>/dev/null || true
     wait $PROXY_PID 2>/dev/null || true
     wait $SHIMMY_PID 2>/dev/null || true
+    rm -f "$SHIMMY_PID_FILE"
     echo "Shutdown complete"
 }
 
@@ -109,6 +114,7 @@ while true; do
             --gpu-backend ${SHIMMY_GPU_BACKEND:-cuda} \
             --model-path ${SHIMMY_MODEL_PATH:-/models} &
         SHIMMY_PID=$!
+        echo $SHIMMY_PID > "$SHIMMY_PID_FILE"
         
         # Wait for Shimmy to be ready
         echo "Waiting for restarted Shimmy to be ready..."
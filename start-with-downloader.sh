@@ -1,6 +1,9 @@
 #!/bin/bash
 set -e
 
+# Shimmy PID is recorded here so the proxy can signal a restart after a pull
+export SHIMMY_PID_FILE=${SHIMMY_PID_FILE:-/tmp/shimmy.pid}
+
 echo "=========================================="
 echo "Starting Shimmy with Model Downloader"
 echo "=========================================="
@@ -13,6 +16,7 @@ echo "=========================================="
 echo "Starting Shimmy on port 8081..."
 shimmy serve --bind 0.0.0.0:8081 --model-path ${SHIMMY_MODEL_PATH:-/models} &
 SHIMMY_PID=$!
+echo $SHIMMY_PID > "$SHIMMY_PID_FILE"
 
 # Wait for Shimmy to be ready
 echo "Waiting for Shimmy to be ready..."
@@ -67,6 +71,7 @@ cleanup() {
     kill $SHIMMY_PID 2>/dev/null || true
     wait $PROXY_PID 2>/dev/null || true
     wait $SHIMMY_PID 2>/dev/null || true
+    rm -f "$SHIMMY_PID_FILE"
     echo "Shutdown complete"
 }
 
@@ -80,6 +85,7 @@ while true; do
         # Restart Shimmy on internal port 8081
         shimmy serve --bind 0.0.0.0:8081 --model-path ${SHIMMY_MODEL_PATH:-/models} &
         SHIMMY_PID=$!
+        echo $SHIMMY_PID > "$SHIMMY_PID_FILE"
         
         # Wait for Shimmy to be ready
         echo "Waiting for restarted Shimmy to be ready..."